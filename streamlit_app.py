@@ -2,20 +2,102 @@ import streamlit as st
 import re
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 from docx import Document
-from docx.shared import Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-import tempfile
+import io
 import os
+import hashlib
+import threading
 from dotenv import load_dotenv
 from PyPDF2 import PdfReader
 from difflib import SequenceMatcher
 import jieba  # 用于中文分词，提高匹配精度
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
 
 # 加载环境变量
 load_dotenv()
 
+# 并发调用API的默认线程数及上限（受DashScope QPS限制）
+DEFAULT_API_WORKERS = 8
+MAX_API_WORKERS = 16
+# 每次API请求合并分析的条款对数量
+ANALYSIS_BATCH_SIZE = 5
+# 每1000个最大输出token对应的请求超时（秒）；非流式请求要等整段回复生成完毕才返回
+API_TIMEOUT_PER_1K_TOKENS = 60
+
+# 分析提示模板，模块加载时构建一次，调用时只做一次 str.format
+# 固定的分析要求放在系统消息中，单组和批量请求共用同一份说明；
+# 每次变化的条款内容放在用户消息中
+CLAUSE_ANALYSIS_SYSTEM_PROMPT = """
+你是中文政策/合同条款合规性分析助手。对每组目标条款和待比对条款进行分析：
+1. 首先明确判断待比对条款是否符合目标条款要求（用"合规"或"不合规"开头）
+2. 指出两者的主要差异点（如无差异则说明一致）
+3. 分析差异可能带来的影响
+4. 注意中文法律/合同条款中常用表述的细微差别
+5. 每组用简洁的中文（不超过300字）输出分析结果
+"""
+
+CLAUSE_PROMPT_TEMPLATE = """
+请仔细分析以下两个中文条款的合规性：
+
+目标条款（第{t_num}条）：
+{target}
+
+待比对条款（第{c_num}条）：
+{compare}
+"""
+
+BATCH_PROMPT_TEMPLATE = """
+请仔细分析以下每组中文条款的合规性，idx 为该组序号。
+以JSON对象返回，格式为：{{"results": [{{"idx": 序号, "analysis": "分析结果"}}]}}
+
+{items}
+"""
+
+# 内容完全一致的条款对无需调用API，直接使用该分析结果
+IDENTICAL_CLAUSE_ANALYSIS = "合规。待比对条款与目标条款内容完全一致，无差异。"
+
+SUMMARY_PROMPT_TEMPLATE = """
+以下是目标政策文件与待比对文件中合规条款的分析结果：
+{results}
+
+额外信息：
+- 总匹配条款数：{total_matched} 条
+- 合规条款数：{total_compliant} 条
+
+请基于以上分析，用简洁的中文（不超过300字）总结：
+1. 总体合规性情况
+2. 主要差异点汇总
+3. 简要的合规建议
+"""
+
+# 预编译正则表达式，避免每次解析文件时重复编译
+CN_NUM = '[一二三四五六七八九十百千]+'
+ATTACHMENT_KEYWORDS = ['附件', '附录', '附表', '附图', '附件一', '附录一', '附件列表']
+# 附件页特征合并为一个正则，正文页（多数情况）只需一次扫描即可排除：
+# 1. 页首为附件标识关键词，且关键词附近有关联表述；只看页首，
+#    避免正文中"附件包括以下材料"之类的表述把该页及之后的正文当作附件跳过
+# 2. 文件格式扩展名（不区分大小写）
+# 3. 附件编号格式
+ATTACHMENT_RE = re.compile(
+    r'^\s*(?:' + '|'.join(ATTACHMENT_KEYWORDS) + r')[：: ]?[^\n]{0,20}(?:如下|内容如下|包括|包含)'
+    r'|\.(?i:pdf|docx?|xlsx?|pptx?|jpg|png|gif|zip|rar|txt)'
+    r'|附件\s*[0-9一二三四五六七八九十]+[:：.、)]'
+)
+# 条款标记：格式1 一、二、三、... 或 格式2 （一）（二）（三）...
+# 命名分组直接给出条款编号，标记后的空白一并匹配，m.end() 即条款内容起点
+CLAUSE_MARKER_RE = re.compile(rf'(?P<comma>{CN_NUM})、\s*|\((?P<paren>{CN_NUM})\)\s*')
+
+# PDF逐页文本中需要删除的换行符，str.translate 一次遍历完成
+LINE_BREAK_TABLE = str.maketrans('', '', '\r\n')
+# 文本预处理：删除控制字符
+CONTROL_CHARS = [*range(0x00, 0x09), 0x0b, 0x0c, *range(0x0e, 0x20), 0x7f]
+TEXT_NORMALIZE_TABLE = str.maketrans({chr(c): None for c in CONTROL_CHARS})
+
 # 设置页面配置
 st.set_page_config(
     page_title="条款式政策比对分析工具",
@@ -36,31 +118,12 @@ st.markdown("""
         margin-top: 1rem;
         background-color: #f9f9f9;
     }
-    .matched-clause {
-        border-left: 4px solid #28a745;
-        padding: 0.75rem;
-        margin: 1rem 0;
-        background-color: #f8fff8;
-    }
     .non-compliant {
         border-left: 4px solid #dc3545;
         padding: 0.75rem;
         margin: 1rem 0;
         background-color: #fff5f5;
     }
-    .difference-section {
-        border-left: 4px solid #ffc107;
-        padding: 0.75rem;
-        margin: 0.5rem 0;
-        background-color: #fffcf2;
-    }
-    .summary-box {
-        border: 1px solid #007bff;
-        border-radius: 5px;
-        padding: 1rem;
-        margin: 1rem 0;
-        background-color: #f0f7ff;
-    }
     .parse-info {
         font-size: 0.9rem;
         color: #6c757d;
@@ -92,6 +155,10 @@ if 'api_key' not in st.session_state:
     st.session_state.api_key = os.getenv("QWEN_API_KEY", "")
 if 'parse_precision' not in st.session_state:
     st.session_state.parse_precision = "中等"  # 解析精度
+if 'analysis_cache' not in st.session_state:
+    st.session_state.analysis_cache = {}  # {请求内容哈希: API分析结果}
+if 'api_workers' not in st.session_state:
+    st.session_state.api_workers = DEFAULT_API_WORKERS  # 并发请求数
 
 # 页面标题
 st.title("📜 条款式政策比对分析工具")
@@ -109,6 +176,20 @@ st.session_state.parse_precision = st.sidebar.select_slider(
     help="宽松：提取更多可能的条款；严格：只提取明确符合格式的条款"
 )
 
+# 分析设置
+st.sidebar.subheader("分析设置")
+st.session_state.api_workers = st.sidebar.slider(
+    "API并发请求数",
+    min_value=1,
+    max_value=MAX_API_WORKERS,
+    value=st.session_state.api_workers,
+    help="同时发起的API请求数量，遇到限流（429）时可适当调低"
+)
+
+# 相同条款对的分析结果会缓存在会话中，重复分析时直接复用；
+# 清除按钮先占位，等本次运行的分析完成后再渲染，显示最新的缓存条数
+cache_controls = st.sidebar.empty()
+
 # API配置
 with st.expander("🔑 API 配置", expanded=not st.session_state.api_key):
     st.session_state.api_key = st.text_input("请输入Qwen API密钥", value=st.session_state.api_key, type="password")
@@ -125,170 +206,225 @@ def is_likely_attachment(text):
     if not text:
         return False
     
-    # 附件通常有以下特征：
-    # 1. 包含附件标识关键词
-    attachment_keywords = ['附件', '附录', '附表', '附图', '附件一', '附录一', '附件列表']
-    for kw in attachment_keywords:
-        if kw in text:
-            # 检查关键词附近是否有关联表述
-            if re.search(f'{kw}[：: ]?[^\n]{0,20}(如下|如下所示|内容如下|包括|包含)', text):
-                return True
-    
-    # 2. 包含文件格式扩展名
-    file_extensions = r'\.(pdf|doc|docx|xls|xlsx|ppt|pptx|jpg|png|gif|zip|rar|txt)'
-    if re.search(file_extensions, text, re.IGNORECASE):
-        return True
-    
-    # 3. 包含附件编号格式
-    if re.search(r'附件\s*[0-9一二三四五六七八九十]+[:：.、)]', text):
-        return True
-        
-    return False
+    # 附件页通常以附件标识开头，或包含文件扩展名、附件编号，见 ATTACHMENT_RE
+    return ATTACHMENT_RE.search(text) is not None
 
 # 文本提取函数，跳过附件内容
 def extract_text_from_pdf(file):
-    """从PDF提取文本，优化中文处理，跳过附件内容"""
-    try:
-        pdf_reader = PdfReader(file)
-        text = ""
-        attachment_count = 0
-        skip_mode = False  # 是否进入跳过模式
+    """从PDF提取文本，优化中文处理，跳过附件内容；返回 (文本, 总页数, 跳过的附件数)"""
+    pdf_reader = PdfReader(file)
+    page_texts = []
+    attachment_count = 0
+    skip_mode = False  # 是否进入跳过模式
+    
+    for page in pdf_reader.pages:
+        page_text = page.extract_text() or ""
         
-        for page in pdf_reader.pages:
-            page_text = page.extract_text() or ""
-            
-            # 处理中文空格和换行问题
-            page_text = page_text.replace("  ", "").replace("\n", "").replace("\r", "")
-            
-            # 检查是否包含附件标识
-            if not skip_mode and is_likely_attachment(page_text):
-                skip_mode = True
-                attachment_count += 1
-                continue  # 跳过当前页
-            
-            # 如果已进入跳过模式，检查是否需要退出
-            if skip_mode:
-                # 连续多页空白或低信息量可能表示附件结束
-                if len(page_text) < 50:
-                    skip_mode = False
-                continue  # 跳过附件页
-            
-            text += page_text
+        # 处理中文空格和换行问题
+        page_text = page_text.replace("  ", "").translate(LINE_BREAK_TABLE)
         
-        # 提示跳过了多少附件内容
-        if attachment_count > 0:
-            st.info(f"已跳过 {attachment_count} 处可能的附件内容")
-            
-        return text
-    except Exception as e:
-        st.error(f"提取文本失败: {str(e)}")
-        return ""
+        # 检查是否包含附件标识
+        if not skip_mode and is_likely_attachment(page_text):
+            skip_mode = True
+            attachment_count += 1
+            continue  # 跳过当前页
+        
+        # 如果已进入跳过模式，检查是否需要退出
+        if skip_mode:
+            # 连续多页空白或低信息量可能表示附件结束
+            if len(page_text) < 50:
+                skip_mode = False
+            continue  # 跳过附件页
+        
+        page_texts.append(page_text)
+    
+    return "".join(page_texts), len(pdf_reader.pages), attachment_count
 
 def split_into_clauses(text):
     """
-    严格按照以下两种格式分割条款：
+    严格按照以下两种格式分割条款，返回 [(条款编号, 条款内容)]：
     1. 一、二、三、……格式（中文数字+顿号）
     2. （一）（二）（三）……格式（括号+中文数字+括号）
+
+    两种标记按在文本中出现的顺序统一处理，每个条款到下一个标记（不论哪种格式）为止，
+    因此"一、"条款的内容在其第一个"(一)"子项之前结束，子项各自成为单独的条款。
     """
-    # 首先识别并提取所有符合两种格式的条款标记
-    # 格式1: 一、二、三、...
-    pattern1 = r'([一二三四五六七八九十百千]+、)'
-    # 格式2: （一）（二）（三）...
-    pattern2 = r'(\([一二三四五六七八九十百千]+\))'
-    
-    # 合并所有可能的条款标记
-    all_markers = re.findall(pattern1, text) + re.findall(pattern2, text)
-    
-    if not all_markers:
-        return []
-    
-    # 使用标记分割文本
-    clauses = []
-    prev_pos = 0
-    
-    # 遍历所有标记并分割文本
-    for marker in all_markers:
-        # 找到当前标记的位置
-        pos = text.find(marker, prev_pos)
-        if pos == -1:
-            continue
-            
-        # 如果是第一个标记，且前面有内容，我们忽略前面的内容
-        if prev_pos == 0 and pos > 0:
-            prev_pos = pos
+    # 一次扫描找出两种格式的所有条款标记，第一个标记之前的内容忽略
+    markers = list(CLAUSE_MARKER_RE.finditer(text))
+    
+    # 条款内容从当前标记之后开始，到下一个标记结束
+    ends = [m.start() for m in markers[1:]] + [len(text)]
+    return [
+        (m.group(m.lastgroup), text[m.end():next_pos].strip())
+        for m, next_pos in zip(markers, ends)
+    ]
+
+@st.cache_resource(show_spinner=False)
+def preload_jieba():
+    """在后台线程中加载jieba词典，整个进程只启动一次，避免首次相似度匹配时等待词典加载"""
+    thread = threading.Thread(target=jieba.initialize, daemon=True)
+    thread.start()
+    return thread
+
+preload_jieba()
+
+@st.cache_data(show_spinner=False, max_entries=4096)
+def tokenize_chinese(text):
+    """使用jieba进行中文分词，结果按文本缓存，同一条款跨文件、跨重跑只分词一次"""
+    return tuple(jieba.cut(text))
+
+def match_clauses_by_similarity(target_clauses, compare_clauses, threshold=0.3):
+    """按内容相似度贪心匹配条款，返回 [(目标条款号, 待比对条款号, 相似度)]"""
+    # 每个条款只分词一次；每个待比对条款的 SequenceMatcher 索引只构建一次，
+    # 逐个目标条款通过 set_seq1 复用，避免在 B×T 次比较中重复分词和建索引
+    target_list = [(num, tokenize_chinese(content)) for num, content in target_clauses.items()]
+    compare_list = []
+    for num, content in compare_clauses.items():
+        matcher = SequenceMatcher(None)
+        matcher.set_seq2(tokenize_chinese(content))
+        compare_list.append((num, matcher))
+    
+    matched_pairs = []
+    used_indices = set()
+    
+    for t_num, t_words in target_list:
+        best_num = None
+        best_ratio = threshold  # 中文匹配阈值
+        best_j = -1
         
-        # 提取当前标记到下一个标记之间的内容
-        next_pos = text.find(all_markers[all_markers.index(marker)+1], pos) if all_markers.index(marker)+1 < len(all_markers) else len(text)
+        for j, (c_num, matcher) in enumerate(compare_list):
+            if j in used_indices:
+                continue
+            matcher.set_seq1(t_words)
+            # real_quick_ratio 只看长度、quick_ratio 只看词频交集，都是 ratio 的上界，
+            # 由廉价到昂贵逐级过滤，无法超过当前最佳时跳过完整比较
+            if matcher.real_quick_ratio() <= best_ratio or matcher.quick_ratio() <= best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio > best_ratio:
+                best_ratio = ratio
+                best_num = c_num
+                best_j = j
         
-        clause = text[pos:next_pos].strip()
-        if clause:
-            clauses.append(clause)
-            
-        prev_pos = next_pos
+        if best_num is not None:
+            matched_pairs.append((t_num, best_num, best_ratio))
+            used_indices.add(best_j)
     
-    return clauses
+    return matched_pairs
 
-def chinese_text_similarity(text1, text2):
-    """计算中文文本相似度，使用分词后匹配"""
-    # 使用jieba进行中文分词
-    words1 = list(jieba.cut(text1))
-    words2 = list(jieba.cut(text2))
+@st.cache_data(show_spinner=False, max_entries=32, ttl=3600)
+def extract_pdf_text(file_bytes):
+    """按文件内容缓存的PDF文本提取与预处理，只以文件字节为键，调整解析精度时无需重新解析PDF；返回 (文本, 总页数, 跳过的附件数)"""
+    # 提取文本并跳过附件
+    full_text, total_pages, attachment_count = extract_text_from_pdf(io.BytesIO(file_bytes))
     
-    # 计算分词后的相似度
-    return SequenceMatcher(None, words1, words2).ratio()
+    # 文本预处理
+    full_text = full_text.translate(TEXT_NORMALIZE_TABLE)  # 移除控制字符
+    full_text = " ".join(full_text.split())  # 统一空白字符
+    return full_text, total_pages, attachment_count
+
+def select_clauses(full_text, precision="中等"):
+    """按指定格式分割条款，并为条款添加编号和按精度过滤；返回 {条款编号: 条款内容}"""
+    clauses = {}
+    for clause_num, clause_content in split_into_clauses(full_text):
+        # 根据精度过滤条款
+        if precision == "严格" and len(clause_content) > 50:
+            clauses[clause_num] = clause_content
+        elif precision == "中等" and len(clause_content) > 30:
+            clauses[clause_num] = clause_content
+        elif precision == "宽松" and len(clause_content) > 20:
+            clauses[clause_num] = clause_content
+    return clauses
+
+@st.cache_data(show_spinner=False, max_entries=32, ttl=3600)
+def extract_clauses(file_bytes, precision="中等"):
+    """按文件内容缓存的条款解析，同一文件重复上传或页面重跑时直接返回结果；返回 (条款字典, 总页数, 跳过的附件数)"""
+    full_text, total_pages, attachment_count = extract_pdf_text(file_bytes)
+    return select_clauses(full_text, precision), total_pages, attachment_count
 
 # PDF解析函数 - 按特定格式分割条款
 def parse_pdf_by_clauses(file, precision="中等"):
     """解析PDF文件并严格按照指定格式分割条款"""
     try:
         with st.spinner("正在解析文件并按指定格式分割条款..."):
-            # 提取文本并跳过附件
-            full_text = extract_text_from_pdf(file)
-            total_pages = len(PdfReader(file).pages)  # 获取总页数
-            
-            # 文本预处理
-            full_text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]', '', full_text)  # 移除控制字符
-            full_text = re.sub(r'\s+', ' ', full_text).strip()  # 统一空白字符
-            
-            # 按指定格式分割条款
-            clauses_list = split_into_clauses(full_text)
-            
-            # 为条款添加编号并过滤
-            clauses = {}
-            for clause in clauses_list:
-                # 提取条款编号（只处理指定的两种格式）
-                num_match = None
-                
-                # 尝试从条款文本中提取编号
-                if re.match(r'\([一二三四五六七八九十百千]+\)', clause):
-                    num_match = re.match(r'\(([一二三四五六七八九十百千]+)\)', clause)
-                elif re.match(r'[一二三四五六七八九十百千]+、', clause):
-                    num_match = re.match(r'([一二三四五六七八九十百千]+)、', clause)
-                
-                if num_match:
-                    clause_num = num_match.group(1)
-                    # 清理条款内容，移除编号部分
-                    clause_content = re.sub(r'^\([一二三四五六七八九十百千]+\)\s*', '', clause)
-                    clause_content = re.sub(r'^[一二三四五六七八九十百千]+、\s*', '', clause_content)
-                else:
-                    # 不应该走到这里，因为split_into_clauses已经过滤了格式
-                    continue
-                
-                # 根据精度过滤条款
-                if precision == "严格" and len(clause_content) > 50:
-                    clauses[clause_num] = clause_content.strip()
-                elif precision == "中等" and len(clause_content) > 30:
-                    clauses[clause_num] = clause_content.strip()
-                elif precision == "宽松" and len(clause_content) > 20:
-                    clauses[clause_num] = clause_content.strip()
-            
-            st.success(f"共解析 {total_pages} 页，按指定格式成功提取 {len(clauses)} 条条款")
-            return clauses
+            clauses, total_pages, attachment_count = extract_clauses(file.getvalue(), precision)
+        
+        # 提示跳过了多少附件内容
+        if attachment_count > 0:
+            st.info(f"已跳过 {attachment_count} 处可能的附件内容")
+        
+        st.success(f"共解析 {total_pages} 页，按指定格式成功提取 {len(clauses)} 条条款")
+        return clauses
             
     except Exception as e:
         st.error(f"文件解析错误: {str(e)}")
         return {}
 
+class QwenAPIError(Exception):
+    """Qwen API返回错误状态码或异常格式"""
+
+@st.cache_resource
+def get_http_session():
+    """创建复用连接的HTTP会话，跨重跑共享，避免每次请求重新建立TCP/TLS连接"""
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        read=False,  # 请求已发出后读取超时不重试：生成请求会计费，且重发会让单个线程长时间阻塞
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["POST"],
+        raise_on_status=False  # 重试耗尽后返回最后一次响应，由调用方报告状态码
+    )
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
+
+def request_qwen(prompt, api_key, model="qwen-turbo", session=None, max_tokens=1000, json_output=False,
+                 system_prompt=None):
+    """向Qwen API发送请求并返回回复内容，失败时抛出异常；不调用st组件，可在工作线程中使用
+
+    json_output 为 True 时启用结构化输出，模型保证返回合法的JSON对象；
+    system_prompt 作为系统消息放在用户消息之前。
+    """
+    session = session or get_http_session()
+    url = "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions"
+    
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    
+    messages = [{"role": "user", "content": prompt}]
+    if system_prompt:
+        messages.insert(0, {"role": "system", "content": system_prompt})
+    
+    data = {
+        "model": model,
+        "messages": messages,
+        "temperature": 0.3,
+        "max_tokens": max_tokens
+    }
+    if json_output:
+        data["response_format"] = {"type": "json_object"}
+    
+    timeout = API_TIMEOUT_PER_1K_TOKENS * max(1, max_tokens / 1000)
+    response = session.post(url, headers=headers, json=data, timeout=timeout)
+    
+    if response.status_code == 200:
+        response_data = response.json()
+        if "choices" in response_data and len(response_data["choices"]) > 0:
+            return response_data["choices"][0]["message"]["content"]
+        raise QwenAPIError(f"API返回格式异常: {response_data}")
+    raise QwenAPIError(f"API调用失败: 状态码 {response.status_code}, 响应: {response.text}")
+
+def describe_api_error(e):
+    """将API请求异常转换为界面提示文字"""
+    if isinstance(e, requests.exceptions.Timeout):
+        return "API请求超时，请重试"
+    if isinstance(e, QwenAPIError):
+        return str(e)
+    return f"API请求错误: {str(e)}"
+
 # 调用Qwen API进行条款比对分析
 def call_qwen_api(prompt, api_key, model="qwen-turbo"):
     """调用Qwen API进行条款比对分析"""
@@ -298,121 +434,195 @@ def call_qwen_api(prompt, api_key, model="qwen-turbo"):
     
     try:
         with st.spinner("正在分析条款..."):
-            url = "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions"
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            }
-            
-            data = {
-                "model": model,
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.3,
-                "max_tokens": 1000
-            }
-            
-            response = requests.post(url, headers=headers, json=data, timeout=60)
-            
-            if response.status_code == 200:
-                response_data = response.json()
-                if "choices" in response_data and len(response_data["choices"]) > 0:
-                    return response_data["choices"][0]["message"]["content"]
-                else:
-                    st.error(f"API返回格式异常: {response_data}")
-                    return None
-            else:
-                st.error(f"API调用失败: 状态码 {response.status_code}, 响应: {response.text}")
-                return None
-                
-    except requests.exceptions.Timeout:
-        st.error("API请求超时，请重试")
-        return None
+            return request_qwen(prompt, api_key, model)
     except Exception as e:
-        st.error(f"API请求错误: {str(e)}")
+        st.error(describe_api_error(e))
         return None
 
+def build_clause_prompt(pair):
+    """生成单组条款对的分析提示"""
+    t_num, c_num, target_content, compare_content = pair
+    return CLAUSE_PROMPT_TEMPLATE.format(
+        t_num=t_num, c_num=c_num, target=target_content[:300], compare=compare_content[:300]
+    )
+
+def build_batch_prompt(batch):
+    """将多组条款对合并为一个分析提示，要求以JSON对象返回各组结果"""
+    items = [
+        {
+            "idx": idx,
+            "目标条款": f"第{t_num}条：{target_content[:300]}",
+            "待比对条款": f"第{c_num}条：{compare_content[:300]}"
+        }
+        for idx, (t_num, c_num, target_content, compare_content) in batch
+    ]
+    return BATCH_PROMPT_TEMPLATE.format(items=json.dumps(items, ensure_ascii=False, indent=2))
+
+def parse_batch_analysis(content, expected_indices):
+    """解析批量分析返回的JSON，返回 {序号: 分析结果}；格式不符时返回空字典"""
+    # API可能返回 "content": null，此时交由逐组请求兜底
+    if not isinstance(content, str):
+        return {}
+    
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        # 未按结构化格式返回时，尝试截取其中的JSON数组
+        start, end = content.find("["), content.rfind("]")
+        if start == -1 or end <= start:
+            return {}
+        try:
+            data = json.loads(content[start:end + 1])
+        except json.JSONDecodeError:
+            return {}
+    
+    items = data.get("results") if isinstance(data, dict) else data
+    
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and item.get("idx") in expected_indices and isinstance(item.get("analysis"), str):
+            results[item["idx"]] = item["analysis"]
+    return results
+
+def analyze_pair_batch(batch, api_key, model, session):
+    """在工作线程中分析一批条款对，返回 [(序号, 分析结果, 异常)]
+
+    整批合并为一次请求；请求失败、返回内容无法解析或缺少某组结果时，该组再单独请求一次。
+    """
+    results = {}
+    if len(batch) > 1:
+        try:
+            content = request_qwen(
+                build_batch_prompt(batch), api_key, model, session,
+                max_tokens=800 * len(batch), json_output=True,
+                system_prompt=CLAUSE_ANALYSIS_SYSTEM_PROMPT
+            )
+            results = parse_batch_analysis(content, {idx for idx, _ in batch})
+        except Exception:
+            pass  # 整批请求失败（如偶发超时）不影响逐组请求
+    
+    outcomes = []
+    for idx, pair in batch:
+        if idx in results:
+            outcomes.append((idx, results[idx], None))
+            continue
+        try:
+            outcomes.append((idx, request_qwen(
+                build_clause_prompt(pair), api_key, model, session,
+                system_prompt=CLAUSE_ANALYSIS_SYSTEM_PROMPT
+            ), None))
+        except Exception as e:
+            outcomes.append((idx, None, e))
+    return outcomes
+
+def analysis_cache_key(model, *parts):
+    """根据模型和请求内容生成API分析结果的缓存键"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (model, *parts):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
 # 合规性分析函数
-def analyze_clause_matches(target_clauses, compare_clauses, api_key, model):
+def analyze_clause_matches(target_clauses, compare_clauses, api_key, model, max_workers=DEFAULT_API_WORKERS):
     """按条款匹配进行合规性分析"""
     if not target_clauses or not compare_clauses:
         st.warning("缺少条款内容，无法进行分析")
         return None, None, 0, 0
     
+    # 分析过程的状态提示共用一个占位元素，原地更新
+    status = st.empty()
+    
     # 找到所有匹配的条款（条款号相同）
     all_matched_clause_nums = [num for num in target_clauses if num in compare_clauses]
     total_matched = len(all_matched_clause_nums)
     
     if not all_matched_clause_nums:
         # 尝试基于内容相似度匹配
-        st.info("未找到编号匹配的条款，尝试基于内容相似度匹配...")
-        target_list = [(num, content) for num, content in target_clauses.items()]
-        compare_list = [(num, content) for num, content in compare_clauses.items()]
-        
-        matched_pairs = []
-        used_indices = set()
-        
-        for i, (t_num, t_content) in enumerate(target_list):
-            best_match = None
-            best_ratio = 0.3  # 中文匹配阈值
-            best_j = -1
-            
-            for j, (c_num, c_content) in enumerate(compare_list):
-                if j not in used_indices:
-                    ratio = chinese_text_similarity(t_content, c_content)
-                    if ratio > best_ratio:
-                        best_ratio = ratio
-                        best_match = (c_num, c_content)
-                        best_j = j
-            
-            if best_match:
-                matched_pairs.append((t_num, best_match[0], best_ratio))
-                used_indices.add(best_j)
+        status.info("未找到编号匹配的条款，尝试基于内容相似度匹配...")
+        matched_pairs = match_clauses_by_similarity(target_clauses, compare_clauses)
         
         if matched_pairs:
             all_matched_clause_nums = [(t_num, c_num) for t_num, c_num, _ in matched_pairs]
             total_matched = len(matched_pairs)
-            st.info(f"基于内容相似度找到 {total_matched} 条可能匹配的条款")
+            status.info(f"基于内容相似度找到 {total_matched} 条可能匹配的条款")
         else:
-            st.info("未找到匹配的条款")
+            status.info("未找到匹配的条款")
             return {}, "未找到匹配的条款，无法进行合规性分析。", 0, total_matched
     
     # 分析每个匹配的条款，筛选合规的
     compliant_results = {}
     non_compliant_results = {}
     
+    # 先整理全部待分析的条款对，再分批并发调用API（网络等待为主，线程可重叠请求）
+    pairs = []
+    for item in all_matched_clause_nums:
+        # 处理两种匹配方式的结果
+        if isinstance(item, tuple):
+            t_num, c_num = item  # 相似度匹配的结果
+        else:
+            t_num = c_num = item  # 编号匹配的结果
+        
+        target_content = target_clauses[t_num]
+        compare_content = compare_clauses[c_num]
+        pairs.append((t_num, c_num, target_content, compare_content))
+    
     with st.spinner(f"正在分析 {total_matched} 条匹配条款，筛选合规条款..."):
         progress_bar = st.progress(0)
-        for i, item in enumerate(all_matched_clause_nums):
-            # 处理两种匹配方式的结果
-            if isinstance(item, tuple):
-                t_num, c_num = item  # 相似度匹配的结果
+        results = [None] * len(pairs)
+        
+        # 内容完全一致的条款对直接判定为合规；已分析过的条款对直接取缓存结果；
+        # 只有其余条款对才调用API
+        cache = st.session_state.analysis_cache
+        cache_keys = [
+            analysis_cache_key(model, t_num, c_num, target_content[:300], compare_content[:300])
+            for t_num, c_num, target_content, compare_content in pairs
+        ]
+        pending_pairs = []
+        for idx, pair in enumerate(pairs):
+            if pair[2] == pair[3]:
+                results[idx] = IDENTICAL_CLAUSE_ANALYSIS
+            elif cache_keys[idx] in cache:
+                results[idx] = cache[cache_keys[idx]]
             else:
-                t_num = c_num = item  # 编号匹配的结果
-                
-            target_content = target_clauses[t_num]
-            compare_content = compare_clauses[c_num]
-            
-            # 生成条款比对提示
-            prompt = f"""
-            请仔细分析以下两个中文条款的合规性：
-            
-            目标条款（第{t_num}条）：
-            {target_content[:300]}
-            
-            待比对条款（第{c_num}条）：
-            {compare_content[:300]}
-            
-            分析要求：
-            1. 首先明确判断待比对条款是否符合目标条款要求（用"合规"或"不合规"开头）
-            2. 指出两者的主要差异点（如无差异则说明一致）
-            3. 分析差异可能带来的影响
-            4. 注意中文法律/合同条款中常用表述的细微差别
-            5. 用简洁的中文（不超过300字）输出分析结果
-            """
+                pending_pairs.append((idx, pair))
+        done = len(pairs) - len(pending_pairs)
+        progress_bar.progress(done / len(pairs))
+        
+        if pending_pairs and not api_key:
+            st.error("请先配置API密钥")
+        elif pending_pairs:
+            # 多组条款对合并为一次请求，减少网络往返；各批次并发执行
+            batches = [
+                pending_pairs[i:i + ANALYSIS_BATCH_SIZE]
+                for i in range(0, len(pending_pairs), ANALYSIS_BATCH_SIZE)
+            ]
             
-            # 调用API分析
-            result = call_qwen_api(prompt, api_key, model)
+            # 工作线程只负责请求，进度和错误提示都在主线程中更新
+            session = get_http_session()
+            shown_errors = set()  # 同一错误（如密钥无效）只提示一次
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(analyze_pair_batch, batch, api_key, model, session)
+                    for batch in batches
+                ]
+                for future in as_completed(futures):
+                    for idx, result, error in future.result():
+                        if error is not None:
+                            message = describe_api_error(error)
+                            if message not in shown_errors:
+                                shown_errors.add(message)
+                                st.error(message)
+                        elif result:
+                            cache[cache_keys[idx]] = result
+                        results[idx] = result
+                        done += 1
+                    
+                    # 更新进度条
+                    progress_bar.progress(done / len(pairs))
+        
+        # 按匹配顺序整理结果
+        for (t_num, c_num, target_content, compare_content), result in zip(pairs, results):
             if result:
                 # 判断是否合规
                 if result.strip().startswith("合规"):
@@ -433,16 +643,13 @@ def analyze_clause_matches(target_clauses, compare_clauses, api_key, model):
                         "analysis": result,
                         "compliant": False
                     }
-            
-            # 更新进度条
-            progress_bar.progress((i + 1) / len(all_matched_clause_nums))
         
         # 限制只保留前50条合规条款
         max_analyze = 50
-        final_compliant = dict(list(compliant_results.items())[:max_analyze])
+        final_compliant = dict(islice(compliant_results.items(), max_analyze))
         
         # 显示分析数量信息
-        st.info(f"""
+        status.info(f"""
         分析完成：
         - 总匹配条款数：{total_matched} 条
         - 合规条款数：{len(compliant_results)} 条
@@ -450,74 +657,79 @@ def analyze_clause_matches(target_clauses, compare_clauses, api_key, model):
         """)
     
     # 生成总体总结
-    summary_prompt = f"""
-    以下是目标政策文件与待比对文件中合规条款的分析结果：
-    {json.dumps(final_compliant, ensure_ascii=False, indent=2)}
-    
-    额外信息：
-    - 总匹配条款数：{total_matched} 条
-    - 合规条款数：{len(compliant_results)} 条
-    
-    请基于以上分析，用简洁的中文（不超过300字）总结：
-    1. 总体合规性情况
-    2. 主要差异点汇总
-    3. 简要的合规建议
-    """
+    summary_prompt = SUMMARY_PROMPT_TEMPLATE.format(
+        results=json.dumps(final_compliant, ensure_ascii=False, indent=2),
+        total_matched=total_matched,
+        total_compliant=len(compliant_results)
+    )
     
-    summary = call_qwen_api(summary_prompt, api_key, model) or "无法生成总结，请检查API配置。"
+    summary_key = analysis_cache_key(model, summary_prompt)
+    if summary_key in st.session_state.analysis_cache:
+        summary = st.session_state.analysis_cache[summary_key]
+    else:
+        summary = call_qwen_api(summary_prompt, api_key, model)
+        if summary:
+            st.session_state.analysis_cache[summary_key] = summary
+        else:
+            summary = "无法生成总结，请检查API配置。"
     
     return final_compliant, summary, len(compliant_results), total_matched
 
 # 生成Word文档
-def generate_word_document(matched_results, summary, target_filename, compare_filename, total_compliant, total_matched):
-    """生成Word格式分析报告"""
-    try:
-        doc = Document()
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_word_document(matched_results, summary, target_filename, compare_filename, total_compliant, total_matched,
+                        report_date):
+    """生成Word格式分析报告的字节内容；结果按输入缓存，页面重跑时不会重复生成"""
+    doc = Document()
+    
+    # 标题
+    title = doc.add_heading("政策文件条款比对分析报告", 0)
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    
+    # 基本信息
+    doc.add_paragraph(f"目标政策文件: {target_filename}")
+    doc.add_paragraph(f"待比对文件: {compare_filename}")
+    doc.add_paragraph(f"分析日期: {report_date}")
+    doc.add_paragraph(f"总匹配条款数: {total_matched}")
+    doc.add_paragraph(f"合规条款数: {total_compliant}")
+    doc.add_paragraph(f"本次报告分析条款数: {len(matched_results)}")
+    doc.add_paragraph("")
+    
+    # 总体总结
+    doc.add_heading("一、总体总结", level=1)
+    for para in summary.splitlines():
+        if para.strip():
+            doc.add_paragraph(para.strip())
+    
+    # 合规条款详细分析
+    doc.add_heading("二、合规条款详细分析", level=1)
+    
+    for clause_num, details in matched_results.items():
+        doc.add_heading(f"目标条款第{details['target_num']}条 vs 待比对条款第{details['compare_num']}条", level=2)
         
-        # 标题
-        title = doc.add_heading("政策文件条款比对分析报告", 0)
-        title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        doc.add_heading("目标条款内容：", level=3)
+        doc.add_paragraph(details["target"])
         
-        # 基本信息
-        doc.add_paragraph(f"目标政策文件: {target_filename}")
-        doc.add_paragraph(f"待比对文件: {compare_filename}")
-        doc.add_paragraph(f"分析日期: {time.strftime('%Y年%m月%d日')}")
-        doc.add_paragraph(f"总匹配条款数: {total_matched}")
-        doc.add_paragraph(f"合规条款数: {total_compliant}")
-        doc.add_paragraph(f"本次报告分析条款数: {len(matched_results)}")
-        doc.add_paragraph("")
+        doc.add_heading("待比对条款内容：", level=3)
+        doc.add_paragraph(details["compare"])
         
-        # 总体总结
-        doc.add_heading("一、总体总结", level=1)
-        for para in re.split(r'\n+', summary):
+        doc.add_heading("分析结果：", level=3)
+        for para in details["analysis"].splitlines():
             if para.strip():
                 doc.add_paragraph(para.strip())
-        
-        # 合规条款详细分析
-        doc.add_heading("二、合规条款详细分析", level=1)
-        
-        for clause_num, details in matched_results.items():
-            doc.add_heading(f"目标条款第{details['target_num']}条 vs 待比对条款第{details['compare_num']}条", level=2)
-            
-            p = doc.add_paragraph("目标条款内容：")
-            p.style = 'Heading 3'
-            doc.add_paragraph(details["target"])
-            
-            p = doc.add_paragraph("待比对条款内容：")
-            p.style = 'Heading 3'
-            doc.add_paragraph(details["compare"])
-            
-            p = doc.add_paragraph("分析结果：")
-            p.style = 'Heading 3'
-            for para in re.split(r'\n+', details["analysis"]):
-                if para.strip():
-                    doc.add_paragraph(para.strip())
-        
-        # 保存到临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp:
-            doc.save(tmp.name)
-            return tmp.name
-            
+    
+    # 直接保存到内存，无需经过临时文件
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+def generate_word_document(matched_results, summary, target_filename, compare_filename, total_compliant, total_matched):
+    """生成Word格式分析报告，返回文档字节内容"""
+    try:
+        return build_word_document(
+            matched_results, summary, target_filename, compare_filename, total_compliant, total_matched,
+            time.strftime('%Y年%m月%d日')
+        )
     except Exception as e:
         st.error(f"生成Word文档失败: {str(e)}")
         return None
@@ -587,7 +799,8 @@ with col1:
                         st.session_state.target_clauses,
                         st.session_state.compare_files[filename]["clauses"],
                         st.session_state.api_key,
-                        model_option
+                        model_option,
+                        st.session_state.api_workers
                     )
                     if matched_results is not None:
                         st.session_state.compare_files[filename]["matched_results"] = matched_results
@@ -635,12 +848,9 @@ with col2:
             if matched_results is not None:
                 # 显示总体总结
                 st.markdown("### 📊 总体分析总结")
-                st.markdown('<div class="summary-box">', unsafe_allow_html=True)
-                st.markdown(f"**匹配与合规概览：** 总匹配条款 {total_matched} 条，其中合规条款 {total_compliant} 条  \n")
-                for para in re.split(r'\n+', summary):
-                    if para.strip():
-                        st.markdown(f"{para.strip()}  \n")
-                st.markdown('</div>', unsafe_allow_html=True)
+                with st.container(border=True):
+                    st.markdown(f"**匹配与合规概览：** 总匹配条款 {total_matched} 条，其中合规条款 {total_compliant} 条")
+                    st.markdown("\n\n".join(para.strip() for para in summary.splitlines() if para.strip()))
                 
                 # 显示合规条款的详细分析
                 if matched_results:
@@ -648,26 +858,19 @@ with col2:
                     
                     for clause_num, details in matched_results.items():
                         st.markdown(f'#### 目标条款第{details["target_num"]}条 vs 待比对条款第{details["compare_num"]}条')
-                        st.markdown('<div class="matched-clause">', unsafe_allow_html=True)
-                        
-                        st.markdown("**目标条款内容：**")
-                        st.write(details["target"][:500] + "..." if len(details["target"]) > 500 else details["target"])
-                        
-                        st.markdown("**待比对条款内容：**")
-                        st.write(details["compare"][:500] + "..." if len(details["compare"]) > 500 else details["compare"])
-                        
-                        st.markdown('<div class="difference-section">', unsafe_allow_html=True)
-                        st.markdown("**分析结果：**")
-                        for para in re.split(r'\n+', details["analysis"]):
-                            if para.strip():
-                                st.markdown(f"{para.strip()}  \n")
-                        st.markdown('</div>', unsafe_allow_html=True)
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
+                        with st.container(border=True):
+                            st.markdown("**目标条款内容：**")
+                            st.write(details["target"][:500] + "..." if len(details["target"]) > 500 else details["target"])
+                            
+                            st.markdown("**待比对条款内容：**")
+                            st.write(details["compare"][:500] + "..." if len(details["compare"]) > 500 else details["compare"])
+                            
+                            st.markdown("**分析结果：**")
+                            st.markdown("\n\n".join(para.strip() for para in details["analysis"].splitlines() if para.strip()))
                 
                 # 生成并下载Word文档
                 if target_file and matched_results is not None:
-                    word_file = generate_word_document(
+                    word_bytes = generate_word_document(
                         matched_results,
                         summary,
                         target_file.name,
@@ -676,15 +879,13 @@ with col2:
                         total_matched
                     )
                     
-                    if word_file:
-                        with open(word_file, "rb") as f:
-                            st.download_button(
-                                label=f"💾 下载 {filename} 的分析报告",
-                                data=f,
-                                file_name=f"政策条款比对报告_{filename}_{time.strftime('%Y%m%d')}.docx",
-                                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                            )
-                        os.unlink(word_file)
+                    if word_bytes:
+                        st.download_button(
+                            label=f"💾 下载 {filename} 的分析报告",
+                            data=word_bytes,
+                            file_name=f"政策条款比对报告_{filename}_{time.strftime('%Y%m%d')}.docx",
+                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                        )
             else:
                 st.info("请点击文件旁的'分析'按钮生成分析结果")
         else:
@@ -692,6 +893,12 @@ with col2:
     else:
         st.info("请上传待比对文件并选择一个文件查看分析结果")
 
+# 清除分析缓存按钮（见侧边栏占位）
+cached_count = len(st.session_state.analysis_cache)
+if cache_controls.button(f"清除分析缓存（{cached_count}条）", disabled=not cached_count, key="clear_analysis_cache"):
+    st.session_state.analysis_cache = {}
+    st.rerun()
+
 # 帮助信息
 with st.expander("ℹ️ 使用帮助"):
     st.markdown("""
@@ -0,0 +1,21 @@
+from streamlit_app import is_likely_attachment
+
+
+def test_page_starting_with_attachment_heading_is_attachment():
+    assert is_likely_attachment("附件：申报材料清单如下 1.申请表 2.营业执照复印件")
+    assert is_likely_attachment("  附录 本办法涉及的术语包括以下几类")
+
+
+def test_body_text_mentioning_attachments_is_not_attachment():
+    page = "三、申报程序：申报单位应当按要求提交材料，本办法所称附件包括以下材料，由主管部门统一审核。"
+    assert not is_likely_attachment(page)
+
+
+def test_attachment_number_and_file_extension_are_attachment():
+    assert is_likely_attachment("详见附件1：项目申请表")
+    assert is_likely_attachment("请下载申请模板.DOCX填写后提交")
+
+
+def test_plain_body_page_is_not_attachment():
+    assert not is_likely_attachment("一、总体要求：各单位应当按照本办法的规定建立健全内部管理制度。")
+    assert not is_likely_attachment("")
@@ -0,0 +1,17 @@
+from streamlit_app import parse_batch_analysis
+
+
+def test_parses_structured_results():
+    content = '{"results": [{"idx": 0, "analysis": "合规。一致"}, {"idx": 1, "analysis": "不合规。缺少期限"}]}'
+    assert parse_batch_analysis(content, {0, 1}) == {0: "合规。一致", 1: "不合规。缺少期限"}
+
+
+def test_falls_back_to_embedded_array():
+    content = '结果如下：[{"idx": 2, "analysis": "合规"}] 以上'
+    assert parse_batch_analysis(content, {2}) == {2: "合规"}
+
+
+def test_unusable_content_returns_empty():
+    assert parse_batch_analysis(None, {0}) == {}
+    assert parse_batch_analysis("无法分析", {0}) == {}
+    assert parse_batch_analysis('{"results": [{"idx": 9, "analysis": "合规"}]}', {0}) == {}
@@ -0,0 +1,31 @@
+from streamlit_app import TEXT_NORMALIZE_TABLE, select_clauses, split_into_clauses
+
+# 两个一级条款，各自包含一个全角括号的子项
+TWO_SECTION_TEXT = (
+    "一、总体要求：各单位应当按照本办法的规定建立健全内部管理制度，明确责任分工并落实到人。"
+    "（一）建立台账制度，定期对照检查并及时整改发现的问题，确保各项要求落到实处。"
+    "二、保障措施：各部门应当加强组织领导，统筹安排工作经费，确保各项任务按期完成。"
+    "（一）加强督促检查，对工作推进不力的单位进行通报批评并限期整改到位。"
+)
+
+
+def test_full_width_sub_clauses_stay_in_their_section():
+    clauses = select_clauses(TWO_SECTION_TEXT.translate(TEXT_NORMALIZE_TABLE), "宽松")
+
+    assert list(clauses) == ["一", "二"]
+    assert clauses["一"].startswith("总体要求")
+    assert "（一）建立台账制度" in clauses["一"]
+    assert clauses["二"].startswith("保障措施")
+    assert "（一）加强督促检查" in clauses["二"]
+
+
+def test_nested_markers_split_in_document_order():
+    text = "前言不计入条款。一、总则内容(一)第一项内容(二)第二项内容二、保障内容(一)督促检查内容"
+
+    assert split_into_clauses(text) == [
+        ("一", "总则内容"),
+        ("一", "第一项内容"),
+        ("二", "第二项内容"),
+        ("二", "保障内容"),
+        ("一", "督促检查内容"),
+    ]